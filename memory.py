@@ -0,0 +1,184 @@
+import gzip
+import os
+import struct
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+try:
+    from .parse import parse_mjlog, mjai_events, dump_mjai
+except ImportError:  # Run as a script next to parse.py, e.g. test.py
+    from parse import parse_mjlog, mjai_events, dump_mjai
+
+
+# Bytes of XML read between two budget checks while loading
+READ_SIZE = 1024
+# Number of XML nodes or MJAI events between two budget checks while
+# parsing or dumping
+CHECK_INTERVAL = 64
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when converting a game allocates more than its budget."""
+
+    def __init__(self, stage, report):
+        super().__init__(
+            '{}: peak {} bytes, xml {} bytes, exceeds budget {} bytes'.format(
+                stage, report['peak'], report['size'], report['budget']))
+        self.stage = stage
+        self.report = report
+
+
+def _check(report, stage, base):
+    current, peak = tracemalloc.get_traced_memory()
+    report['peak'] = max(report['peak'], peak - base)
+    if report['budget'] is not None and report['peak'] > report['budget']:
+        raise MemoryBudgetExceeded(stage, report)
+    return current, peak
+
+
+def _record(report, stage, base):
+    current, peak = _check(report, stage, base)
+    report['stages'][stage] = {'peak': peak - base, 'retained': current - base}
+    tracemalloc.reset_peak()
+
+
+def _checked(items, report, stage, base, interval=CHECK_INTERVAL):
+    for i, item in enumerate(items):
+        if i % interval == 0:
+            _check(report, stage, base)
+        yield item
+
+
+def _xml_size(filepath):
+    """Return whether the file is gzipped and the size of its XML."""
+    with open(filepath, 'rb') as file_:
+        gzipped = file_.read(2) == b'\x1f\x8b'
+        if not gzipped:
+            return False, os.fstat(file_.fileno()).st_size
+        # ISIZE of the gzip trailer, the uncompressed size modulo 2**32
+        file_.seek(-4, os.SEEK_END)
+        return True, struct.unpack('<I', file_.read(4))[0]
+
+
+def _load(filepath, gzipped, report, base):
+    root = None
+    parser = ET.XMLPullParser(events=('start',))
+    with (gzip.open(filepath) if gzipped else open(filepath, 'rb')) as file_:
+        for chunk in iter(lambda: file_.read(READ_SIZE), b''):
+            parser.feed(chunk)
+            for _, node in parser.read_events():
+                if root is None:
+                    root = node
+            _check(report, 'load', base)
+    parser.close()
+    return root
+
+
+def _new_report(budget):
+    return {'stages': {}, 'stage': None, 'peak': 0, 'size': None,
+            'budget': budget, 'events': None, 'skipped': None, 'error': None}
+
+
+def convert_with_budget(filepath, budget=None, perspectives=False, report=None):
+    """Convert a mjlog file into MJAI events while accounting allocations.
+
+    ``tracemalloc`` must be tracing. Each stage ('load', 'parse', 'events'
+    and 'dump') is measured relative to the memory in use before the game,
+    and the data of a stage is released as soon as the next stage is done.
+    A game is skipped before loading when its XML alone is larger than the
+    budget. The budget is then checked every ``READ_SIZE`` bytes of XML
+    while loading, every ``CHECK_INTERVAL`` nodes while parsing, every
+    round while building events, every ``CHECK_INTERVAL`` events while
+    dumping, and after each stage.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of mjlog file.
+
+    budget : int
+        When given, maximum peak bytes allowed for the game.
+
+    perspectives : bool
+        Passed to ``dump_mjai``.
+
+    report : dict
+        When given, filled in place, so that it is still available when
+        the conversion raises.
+
+    Returns
+    -------
+    tuple
+        Result of ``dump_mjai`` and the report, a dict with keys 'stages'
+        (peak and retained bytes per finished stage), 'stage' (last stage
+        started), 'peak', 'size' (bytes of XML), 'budget', 'events',
+        'skipped' and 'error'. The last two stay None here and are filled
+        by ``convert_files`` for games it skips.
+
+    Raises
+    ------
+    MemoryBudgetExceeded
+        When the peak of the game exceeds ``budget``.
+
+    RuntimeError
+        When ``tracemalloc`` is not tracing.
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('tracemalloc is not tracing; call tracemalloc.start()')
+    if report is None:
+        report = _new_report(budget)
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    report['stage'] = 'load'
+    gzipped, report['size'] = _xml_size(filepath)
+    if budget is not None and report['size'] > budget:
+        raise MemoryBudgetExceeded('load', report)
+    root = _load(filepath, gzipped, report, base)
+    _record(report, 'load', base)
+    report['stage'] = 'parse'
+    parsed = parse_mjlog(_checked(root, report, 'parse', base))
+    del root
+    _record(report, 'parse', base)
+    report['stage'] = 'events'
+    rounds = _checked(parsed['rounds'], report, 'events', base, interval=1)
+    lines = mjai_events(dict(parsed, rounds=rounds))
+    del parsed, rounds
+    report['events'] = len(lines)
+    _record(report, 'events', base)
+    report['stage'] = 'dump'
+    result = dump_mjai(_checked(lines, report, 'dump', base), perspectives)
+    del lines
+    _record(report, 'dump', base)
+    return result, report
+
+
+def convert_files(filepaths, budget=None, perspectives=False):
+    """Convert many mjlog files, skipping games that fail or exceed the budget.
+
+    Yields
+    ------
+    tuple
+        (filepath, result, report) for each file. ``result`` is None when
+        the game was skipped. ``report['skipped']`` then holds the stage
+        that exceeded the budget, or ``report['error']`` the exception
+        raised in ``report['stage']``.
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        for filepath in filepaths:
+            report = _new_report(budget)
+            try:
+                result, _ = convert_with_budget(
+                    filepath, budget, perspectives, report)
+            except MemoryBudgetExceeded as e:
+                result = None
+                report['skipped'] = e.stage
+            except Exception as e:
+                result = None
+                report['error'] = e
+            yield filepath, result, report
+    finally:
+        if not tracing:
+            tracemalloc.stop()
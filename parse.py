@@ -537,8 +537,69 @@ def translate(tile):
 
 import json
 
-def parse_mjlog_to_mjai(root_node):
-    parsed = parse_mjlog(root_node)
+def _dump_line(line):
+    return json.dumps(line, separators=(',', ':'), ensure_ascii=False)
+
+
+def _split_perspectives(lines):
+    """Serialize mjai events into the full view and the four player views.
+
+    In the view of player ``i``, ``tehais`` of the other players and their
+    ``tsumo`` tiles are masked to ``?``. Events that are identical across
+    views are serialized only once and shared.
+    """
+    full = []
+    views = [[], [], [], []]
+    for line in lines:
+        dumped = _dump_line(line)
+        full.append(dumped)
+        if line['type'] == 'tsumo':
+            masked = _dump_line(dict(line, pai='?'))
+            for player, view in enumerate(views):
+                view.append(dumped if player == line['actor'] else masked)
+        elif line['type'] == 'start_kyoku':
+            for player, view in enumerate(views):
+                view.append(_dump_line(dict(line, tehais=[
+                    tehai if i == player else ['?'] * len(tehai)
+                    for i, tehai in enumerate(line['tehais'])
+                ])))
+        else:
+            for view in views:
+                view.append(dumped)
+    return '\n'.join(full), ['\n'.join(view) for view in views]
+
+
+def parse_mjlog_to_mjai(root_node, perspectives=False):
+    """Convert mjlog XML node into MJAI events, one JSON object per line.
+
+    Parameters
+    ----------
+    root_node (Element)
+        Root node of mjlog XML data.
+
+    perspectives : bool
+        When True, also produce the stream seen by each player, where the
+        other players' ``tehais`` and ``tsumo`` tiles are masked to ``?``.
+
+    Returns
+    -------
+    str or tuple
+        MJAI events joined by newlines. When ``perspectives`` is True,
+        a tuple of the full-information stream and a list of four
+        per-player streams indexed by seat.
+    """
+    return dump_mjai(mjai_events(parse_mjlog(root_node)), perspectives)
+
+
+def dump_mjai(lines, perspectives=False):
+    """Serialize MJAI events, see ``parse_mjlog_to_mjai``."""
+    if perspectives:
+        return _split_perspectives(lines)
+    return '\n'.join(_dump_line(line) for line in lines)
+
+
+def mjai_events(parsed):
+    """Convert the result of ``parse_mjlog`` into a list of MJAI events."""
     game = parsed['meta']
     global red
     red = game['GO']['config']['red']
@@ -696,4 +757,4 @@ def parse_mjlog_to_mjai(root_node):
         
         lines.append({"type": "end_kyoku"})
     lines.append({"type": "end_game"})
-    return '\n'.join(json.dumps(line, separators=(',', ':'), ensure_ascii=False) for line in lines)
\ No newline at end of file
+    return lines
\ No newline at end of file
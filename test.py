@@ -1,9 +1,38 @@
 import xml.etree.ElementTree as ET
 import os
+import json
+import random
 from parse import *
 import subprocess
 
 path = "check/"
+
+def check_perspectives(root, parsed):
+    full, views = parse_mjlog_to_mjai(root, perspectives=True)
+    assert full == parsed
+    lines = full.split("\n")
+    for player, view in enumerate(views):
+        view = view.split("\n")
+        assert len(view) == len(lines)
+        for i, j in zip(lines, view):
+            event = json.loads(j)
+            if event['type'] == 'start_kyoku':
+                for k, tehai in enumerate(event['tehais']):
+                    assert k == player or set(tehai) == {'?'}, (player, j)
+            elif event['type'] == 'tsumo':
+                assert (event['actor'] == player) != (event['pai'] == '?'), (player, j)
+                if event['actor'] == player:
+                    assert i == j, (player, i, j)
+            else:
+                assert i == j, (player, i, j)
+            i, j = json.loads(i), event
+            if i['type'] == 'tsumo' and i['actor'] != player:
+                i['pai'] = '?'
+            elif i['type'] == 'start_kyoku':
+                i['tehais'] = [tehai if k == player else ['?'] * len(tehai)
+                               for k, tehai in enumerate(i['tehais'])]
+            assert i == j, (player, i, j)
+
 def main():
     log_file = open("log.txt", "a", encoding='utf-8')
     for file in os.listdir(path):
@@ -16,6 +45,7 @@ def main():
             print("parse_mjlog_to_mjai failed:", file, file=log_file)
             print("reason: ", e, file=log_file)
             continue
+        check_perspectives(root, parsed)
         tenhou_id = file.split(".")[0].split("&")[0]
         cmd = "path/to/akochan_ui/mjai-reviewer/target/debug/mjai-reviewer --no-review --tenhou-id " + tenhou_id + " --mjai-out -"
         try:
@@ -38,5 +68,285 @@ def main():
         except:
             print("FAILED: ", tenhou_id)
             print("FAILED: ", tenhou_id, file=log_file)
+
+def _reference_round(rng, n, oya, last):
+    tiles = list(range(136))
+    rng.shuffle(tiles)
+    hands = [tiles[13 * i:13 * (i + 1)] for i in range(4)]
+    dead, live = tiles[52:66], tiles[66:]
+    xml = ['<INIT seed="%d,0,0,%d,%d,%d" ten="250,250,250,250" oya="%d" %s/>' % (
+        n, rng.randrange(6), rng.randrange(6), dead[5], oya,
+        ' '.join('hai%d="%s"' % (i, ','.join(map(str, hand)))
+                 for i, hand in enumerate(hands)))]
+    kans, pons, reached = 0, [[], [], [], []], set()
+    player, draw = oya, True
+    while live:
+        dora = None
+        if draw:
+            tile = live.pop()
+            xml.append('<%s%d/>' % ('TUVW'[player], tile))
+            r = rng.random()
+            if kans < 4 and r < 0.01:  # Ankan
+                kans += 1
+                xml.append('<N who="%d" m="%d"/>' % (player, (tile // 4 * 4) << 8))
+                xml.append('<DORA hai="%d"/>' % dead[3 + 2 * kans])
+                tile = dead[[1, 0, 3, 2][kans - 1]]
+                xml.append('<%s%d/>' % ('TUVW'[player], tile))
+            elif kans < 4 and pons[player] and r < 0.05:  # Kakan
+                kans += 1
+                xml.append('<N who="%d" m="%d"/>' % (
+                    player, pons[player].pop() * 3 << 9 | 1 << 4 | 1))
+                tile = dead[[1, 0, 3, 2][kans - 1]]
+                xml.append('<%s%d/>' % ('TUVW'[player], tile))
+                dora = dead[3 + 2 * kans]
+        if player not in reached and len(live) > 20 and rng.random() < 0.02:
+            reached.add(player)
+            xml.append('<REACH who="%d" step="1"/>' % player)
+            discard = tile
+        else:
+            discard = tile if rng.random() < 0.4 else rng.randrange(136)
+        xml.append('<%s%d/>' % ('DEFG'[player], discard))
+        if xml[-2].startswith('<REACH'):
+            xml.append('<REACH who="%d" ten="250,250,250,240" step="2"/>' % player)
+        if dora is not None:
+            xml.append('<DORA hai="%d"/>' % dora)
+        caller = (player + rng.randrange(1, 4)) % 4
+        rel = (player - caller) % 4
+        kind, r = discard // 4, rng.random()
+        draw = False
+        if r < 0.01 and len(live) < 50:
+            result = ' owari="250,0.0,250,0.0,250,0.0,250,0.0"' if last else ''
+            xml.append(
+                '<AGARI ba="0,%d" hai="%s" machi="%d" ten="30,7700,0" yaku="1,1,7,1"'
+                ' doraHai="%d"%s who="%d" fromWho="%d"'
+                ' sc="250,77,250,-77,250,0,250,0"%s/>' % (
+                    len(reached), ','.join(map(str, hands[caller] + [discard])),
+                    discard, dead[5],
+                    ' doraHaiUra="%d"' % dead[4] if caller in reached else '',
+                    caller, player, result))
+            return xml
+        elif r < 0.04 and kind < 27 and caller not in reached:  # Chi
+            caller, rel = (player + 1) % 4, 3
+            base = kind // 9 * 7 + min(kind % 9, 6)
+            xml.append('<N who="%d" m="%d"/>' % (caller, (base * 3 + rng.randrange(3)) << 10
+                       | rng.randrange(64) << 3 | 1 << 2 | rel))
+        elif r < 0.07 and caller not in reached:  # Pon
+            pons[caller].append(kind)
+            xml.append('<N who="%d" m="%d"/>' % (caller, (kind * 3 + rng.randrange(3)) << 9
+                       | rng.randrange(4) << 5 | 1 << 3 | rel))
+        elif r < 0.075 and kans < 4 and caller not in reached:  # Minkan
+            kans += 1
+            xml.append('<N who="%d" m="%d"/>' % (caller, discard << 8 | rel))
+            tile = dead[[1, 0, 3, 2][kans - 1]]
+            xml.append('<%s%d/>' % ('TUVW'[caller], tile))
+            xml.append('<%s%d/>' % ('DEFG'[caller], tile))
+            xml.append('<DORA hai="%d"/>' % dead[3 + 2 * kans])
+            caller = (caller + 1) % 4
+            draw = True
+        else:
+            caller = (player + 1) % 4
+            draw = True
+        player = caller
+        if not draw:
+            tile = rng.randrange(136)
+    result = ' owari="250,0.0,250,0.0,250,0.0,250,0.0"' if last else ''
+    xml.append('<RYUUKYOKU ba="0,%d" sc="250,0,250,0,250,0,250,0"%s/>' % (
+        len(reached), result))
+    return xml
+
+def reference_games(count=12, seed=0):
+    """Generate the mjlogs pinned by PEAK_BYTES_PER_EVENT.
+
+    Draws, discards, chi, pon, kans with dora, reach, agari and ryuukyoku
+    follow the mjlog encoding; the tiles themselves are random.
+    """
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        rounds = rng.randint(6, 12)
+        xml = ['<mjloggm ver="2.3"><GO type="169" lobby="0"/>'
+               '<UN n0="%41" n1="%42" n2="%43" n3="%44" dan="16,16,16,16"'
+               ' rate="2000.00,2000.00,2000.00,2000.00" sx="M,M,M,M"/>'
+               '<TAIKYOKU oya="0"/>']
+        for n in range(rounds):
+            xml += _reference_round(rng, n, n % 4, n == rounds - 1)
+        xml.append('</mjloggm>')
+        games.append(''.join(xml))
+    return games
+
+# Peak bytes allocated per MJAI event while converting reference_games(),
+# half of them gzipped. Measured maximum 674 on Python 3.11, plus a 10%
+# margin. Re-pin from the maximum printed by `python test.py memory` when
+# reference_games() changes.
+PEAK_BYTES_PER_EVENT = 741
+
+def check_memory():
+    import gzip
+    import tempfile
+    import tracemalloc
+    from memory import convert_with_budget
+    tracemalloc.start()
+    maximum, measured, failed = 0, 0, []
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for n, xml in enumerate(reference_games()):
+            file = os.path.join(directory, '%02d.mjlog' % n)
+            with (gzip.open(file, 'wt') if n % 2 else open(file, 'w')) as f:
+                f.write(xml)
+            files.append(file)
+        for file in files:
+            try:
+                parsed, report = convert_with_budget(file)
+            except Exception as e:
+                print("parse_mjlog_to_mjai failed:", file)
+                print("reason: ", e)
+                failed.append(file)
+                continue
+            per_event = report['peak'] / report['events']
+            maximum = max(maximum, per_event)
+            measured += 1
+            print("peak bytes per event:", int(per_event), report['events'], os.path.basename(file))
+            assert per_event <= PEAK_BYTES_PER_EVENT, report
+    print("maximum peak bytes per event:", int(maximum))
+    assert not failed and measured == len(files), failed
+
+# Known seed and first wall, to check wall.py without check/. The seed is the
+# SHUFFLE seed of http://tenhou.net/0/?log=2014021221gm-00a9-0000-23324af3,
+# quoted in the tenhou.cpp port of http://tenhou.net/stat/rand/ shipped by
+# pymahjong (ThirdParty/tenhou). Yama and dices are the output of that C++
+# port; haipai, rinshan, dora and ura follow pymahjong's Table, which deals
+# from the back of the yama (4-4-4-1 from oya), draws rinshan from the front
+# (yama[1], yama[0], yama[3], yama[2]) and reads dora from yama[5, 7, ...]
+# and ura from yama[4, 6, ...]. Not checked against the INIT of that log.
+WALL_SEED = (
+    "4kWli4p7kSxTf5N7qgwE2JVnrkb1eopM2WQsYI8eBRV+Vf1mFWawMwR+OpSY2Xx5"
+    "rwv+lBZrkKqVQ+evyxA+nVhGXXoz5dPyxTUXSSUliusfFe4fXKvv1LcQalfxi53u"
+    "7avVNq8wzjSH/OkdeM0SiBwsRgbkTCbhc7rmyYSXCPNiXXJkkebd1gc7gecn77dY"
+    "1LzvgD2yDJ1sElOddETUVmwmxwyN84BEBXhX1gPnImBZ3u1A1btlyyyNzJiybdK6"
+    "pqEWmiPXXIxTCCRrGe80O2dcC8JXZUngmIPrEriMSsL+cq+0ObR+v+YxMCKJgNyZ"
+    "XuDAv1j2Dpc/QTauSxImPzbWkPx2jQJlnlQXWGZb0Hqf6HlVBZ3VlbFdWcFteDyV"
+    "VnJG0KLyInQDIrFIZRn0kML7QEkGsJXl+Hz2hGTpkyB+F733xqajtbjFxrQgOu/I"
+    "XMGM5MppkFsGNeycQJvZYbRDLui2bw5Y1tz+4qy8HykWZzhGwSY3CPVgTxyWa8by"
+    "7J27cSBlfVtwjaXmGthHC69gzIgFkIhfBRuAJBqu704S20T70kXZRYIo8mOEXaJq"
+    "Tmv6hXzm8ML/mVJv5YQIJPvttgRai55cJDLbQf4gNIi3JKGX4vYzKypc81kXjKR/"
+    "QT6ddKReTAgDyb3kaPdgrn+mdwHQgk4YVyWCai6+N39KO9kpvdR5y1P/YAGhp33p"
+    "Q2LoSp0I20dtLu7UsCrC7YkT/UbdD7maTcRP9g9HZnkPIgZ4iGYBQpP+jpQRNCa5"
+    "UJ5WLa5NsY3gI3r6Pynwn+S2SQ5B2lDy8q9fJA64UnxHO0YOzHoCNTLHjtGVCYDJ"
+    "wTlyBm+uchE/pFr8yWJ5ohHIO6ZQiReFM+lZUwtWtd0TIaTCpXZMeXCYhhnn5nXL"
+    "7OaZZXHBSxTJC8ig/Ngxz4oBK3YG0BnAmWLFD7Sk65U7t6KqVOexE/QMNF6my37S"
+    "Bg9KrMHAHVHHa/IIPOuHPegnZlaEmWYsich2i6yjhXoejhKe4Xzuit+yjrnxLCsa"
+    "LsBb3YmPQVmM5vqMHNHgrXly6kPreMWnW9q6RAE7dYe56awRVfjxU3IpZ6zQNV/g"
+    "V8eIhhgYfQpt0qV2jG532Nxn5TELOb8mEVSOKXop1VOZrK68WnLGJfh5BtZWMA0k"
+    "xhI5qRqftckDI0NpM73O0d7pZKpYBfaPwmfTqFIRbPLz2JK45WMCX0vh4HS8GHCg"
+    "UQ76QYK/WPlvBzAFMpD6fTmaCYPv4q71MwSKCyjViYfHJKkSqHdneLIsZyC5KNU7"
+    "td1uVOE4oIE6/3PGEEahbZRQOVnR8UtG/lErpSB9KljvOElLFxb3+Dr7WGrbIaEo"
+    "tPmE7VY+Zp6R6x4dhudakIbW+1McSjhQiNXznpYw21h8zWqE8hUZUYpo50J6RILV"
+    "yRjxk89D/tetI3qz9+vIvU2T/b2Qgq5drGbJReP22qW6GwqZXDiaZae4vNjGqyiM"
+    "KrurRV4eQ5nvBJMom8FOJjql09MrZ2pN6JdhToS4Jog019zo1SSnOowHA0wjOcNK"
+    "c4vRrmuq+9OgnM59uAGltoZLH/Q1OSE7XvOZesjC6mtTnQpsU4Axw/BIQChPX6ux"
+    "hSLzvvasE+tozQy8tR+X/sX1596wfj3cp1DKtbeoqQA+j1qDVo/Mg2TgTa10KHdy"
+    "29knG6qZdDODlp32wVEWkfuhFcqrMGfbkFa4e42aYRKUwx4GXM1qLdE1LBSwghbE"
+    "m4LOcLGrGas58ZXvYTEd1CZ/uQVB8lqMFfKNL9H1XAjol7FNZ1IiEl+1Y+WuFzBt"
+    "bFT2EvfxjKWo9CKtz3uomTI2drYnGQgWz1yKbpvEbJeMNA1iW9Hc844bDJyBS7i2"
+    "YdNQEv304sqnffr8XVSFsHaeiOuxPsrq1db8yXeQ6uT9ADsVoxxhHE6P7t83UALV"
+    "bPyY7rMTBUB6OP5/zW35/xFQjwr9rKs3KR5w9kRpEfwK1684NtMHZ3EbWtkZe2Hn"
+    "q8qTKfRyyqP+y6A+/I9G/PhQnSyK5oNYJ3+LMswgX3xarQAzE+75PMGrSPeaoJqL"
+    "4cW81QdccFIYJ5RPUPZSH2EeUaTE3dNqmrUFOBkbEi7gYiNCLgvkPHSv3muF55dc"
+    "/Xi+Hy/pEiP54B5HsWceafN6PtSAZHsn18XPd65hq2f5yIMY783kKdMzv7yCQCWJ"
+    "Z7M3P8uB0qgJZ/7hx7uZtbA+NjxhRo0L0jSlkWVtejVN6q2ndLTJtiX5XC90M6dh"
+    "F7UjT/q4w/xGgMdimTbtrknsXb7kvoa6qkgZiUTPPc9CQakB+7gWFH83fQaSBaIE"
+    "mJ5d/uVwnlzYJO2ufpEKMLlNU+vAEJpSMC98VI+N7jJc5aCG1EyH1tNtFaNmE54D"
+    "zgEeOVcSpCkcyq0poCL4PQuo9H0NfGNiA3AsMSbda1cIupkuy1XE5z5LqG90xqBW"
+    "3uzH2HKBupplfqILDgXAYwCFCWj5Wz65+qAKR5cU40dxKK4Etu2PxVc7WZWP9JwA"
+    "FmvtGkCAhDRrnBK25NPRttHyfb88xEt+8JsCzZm2otDF9hD/QHGYKrebWHyD5wX1"
+    "ObQOJn/GRSxHBUT/jSXi3tN4ddoCbMbtuun3kL+3Lo1HDYK6o8LYXQQzUNPDSgxf"
+    "RG337b62WocN7dl69q/XueBSsH+sVMKUX4GJeLFVqznaRwnzMoHooXR8+CDGylqu"
+    "cEfwzNZLy9z1+OE/v5aRuHa26u4NXrdknvEF0dhacVKHl3fxpr5d56psquT58C5o"
+    "AdYPeFFkoMuM4mmFOn1xfcRlY8hkmadoskznT6e+uHnAXchdWVtpZoX2Hx9notwG"
+    "y+J9gO2qvr1fU9xce50IAANdbGnU9+VafciuUw/Jp2TP68OQfCSWjcHynPgCDZOz"
+    "EDCCuCa5O/EZPyy7XCMpnug63zaaAiQ9wnAjsVyIPaSkiGlzAnc/KqMiAW0rQSOW"
+    "4eNpalu/NAd4X7vc0PMHgqQId47VXSPMmVpk6OAkb4HVUotRtoxhYXlOGPDglDsH"
+    "M/8BCiiZwQylVdaLC7z4heIPJtLLyIQcfUjV8WrkRHBASKdQBxIEIV2bumzmdCsU"
+    "Jcn9zLCjAep8xkRCwfMePaBy1sOrOkgekdCaPTHCjJl3LT/7MISBvXe9tIOGAAZx"
+    "ckCIJd8ZwIGCN/bm9J4wVSWMIz0iUespN+e/uosacvTm3avzebEU5Pd5WpmjsQ9A"
+    "hjMRHt4VP8eBjX1Lb0wqKl0MoTk5MUkS/vxVWcx/WaDTDV/2gfc94qgFBUHTzB27"
+    "hOsEKgzMxc5vRKjfkzdZxs/fe7MlwXxHHvreYUYIB2ogB9TDHVuf7maIL30d3RQ5"
+)
+WALL_YAMA = [
+    12, 95, 40, 26, 28, 119, 17, 104, 108, 63, 73, 92, 34, 128, 118, 65, 75,
+    122, 22, 31, 57, 121, 4, 39, 101, 120, 35, 110, 115, 9, 129, 1, 47, 41,
+    0, 89, 127, 5, 36, 91, 23, 61, 79, 29, 7, 15, 102, 66, 116, 68, 133, 19,
+    53, 125, 82, 20, 83, 105, 71, 10, 14, 77, 72, 44, 70, 27, 69, 117, 24,
+    2, 78, 59, 86, 132, 6, 16, 114, 103, 76, 48, 32, 135, 124, 56, 99, 8,
+    33, 94, 52, 131, 38, 111, 30, 93, 45, 21, 74, 113, 67, 55, 109, 112, 98,
+    13, 51, 123, 97, 81, 87, 88, 126, 3, 90, 18, 43, 85, 100, 50, 54, 42,
+    107, 46, 80, 96, 130, 64, 62, 11, 49, 134, 25, 58, 84, 60, 37, 106
+]
+WALL_DICES = [5, 0]
+WALL_HAIPAI = [
+    [106, 37, 60, 84, 42, 54, 50, 100, 13, 98, 112, 109, 94],
+    [58, 25, 134, 49, 85, 43, 18, 90, 55, 67, 113, 74, 33],
+    [11, 62, 64, 130, 3, 126, 88, 87, 21, 45, 93, 30, 8],
+    [96, 80, 46, 107, 81, 97, 123, 51, 111, 38, 131, 52, 99]
+]
+WALL_RINSHAN = [95, 12, 26, 40]
+WALL_DORA_MARKERS = [119, 104, 63, 92, 128]
+WALL_URA_MARKERS = [28, 17, 108, 73, 34]
+WALL_FIRST_TSUMO = 56
+
+def check_wall_reference():
+    from wall import SEED_PREFIX, reconstruct_game_walls
+    hands = ' '.join('hai%d="%s"' % (i, ','.join(map(str, hand)))
+                     for i, hand in enumerate(WALL_HAIPAI))
+    root = ET.fromstring(
+        '<mjloggm ver="2.3">'
+        '<SHUFFLE seed="%s%s" ref=""/>' % (SEED_PREFIX, WALL_SEED) +
+        '<GO type="169" lobby="0"/>'
+        '<UN n0="A" n1="B" n2="C" n3="D" dan="0,0,0,0" rate="1500,1500,1500,1500" sx="M,M,M,M"/>'
+        '<TAIKYOKU oya="0"/>'
+        '<INIT seed="0,0,0,%d,%d,%d" ten="250,250,250,250" oya="0" %s/>'
+        % (WALL_DICES[0], WALL_DICES[1], WALL_DORA_MARKERS[0], hands) +
+        '<T%d/><D%d/>' % (WALL_FIRST_TSUMO, WALL_FIRST_TSUMO) +
+        '<RYUUKYOKU ba="0,0" sc="250,0,250,0,250,0,250,0"/>'
+        '</mjloggm>')
+    wall, = reconstruct_game_walls(root)
+    assert wall['yama'] == WALL_YAMA
+    assert wall['dices'] == WALL_DICES
+    assert wall['haipai'] == WALL_HAIPAI
+    assert wall['rinshan'] == WALL_RINSHAN
+    assert wall['dora_markers'] == WALL_DORA_MARKERS
+    assert wall['ura_markers'] == WALL_URA_MARKERS
+    assert wall['errors'] == [], wall['errors']
+    print("success: wall reference")
+
+def check_wall():
+    from wall import reconstruct_walls
+    check_wall_reference()
+    if not os.path.isdir(path):
+        print("skipped:", path, "not found")
+        return
+    files = [os.path.join(path, file) for file in os.listdir(path)]
+    failed = []
+    for file, walls, error in reconstruct_walls(files, processes=os.cpu_count()):
+        if error is not None:
+            print("reconstruct_walls failed:", file)
+            print("reason: ", repr(error))
+            failed.append(file)
+            continue
+        errors = [(n, e) for n, wall in enumerate(walls) for e in wall['errors']]
+        for n, e in errors:
+            print("wall mismatch:", file, "round", n, e)
+        if errors:
+            failed.append(file)
+        else:
+            print("success:", file)
+    assert not failed, failed
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    if sys.argv[1:] == ["memory"]:
+        check_memory()
+    elif sys.argv[1:] == ["wall"]:
+        check_wall()
+    else:
+        main()
\ No newline at end of file
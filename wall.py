@@ -0,0 +1,213 @@
+import base64
+import hashlib
+import random
+import struct
+from multiprocessing import Pool
+
+try:
+    from .parse import load_mjlog, parse_mjlog
+except ImportError:  # Run as a script next to parse.py, e.g. test.py
+    from parse import load_mjlog, parse_mjlog
+
+
+SEED_PREFIX = 'mt19937ar-sha512-n288-base64,'
+
+# Layout of the dead wall (yama[0:14]), see http://tenhou.net/stat/rand/
+RINSHAN = [1, 0, 3, 2]
+DORA_MARKERS = [5, 7, 9, 11, 13]
+URA_MARKERS = [4, 6, 8, 10, 12]
+
+
+###############################################################################
+def _init_by_array(key):
+    # Adopted from mt19937ar.c, init_genrand(19650218) + init_by_array
+    mt = [19650218]
+    for i in range(1, 624):
+        prev = mt[-1]
+        mt.append((1812433253 * (prev ^ (prev >> 30)) + i) & 0xffffffff)
+    i, j = 1, 0
+    for _ in range(max(624, len(key))):
+        prev = mt[i - 1]
+        mt[i] = ((mt[i] ^ ((prev ^ (prev >> 30)) * 1664525))
+                 + key[j] + j) & 0xffffffff
+        i, j = i + 1, j + 1
+        if i >= 624:
+            mt[0] = mt[623]
+            i = 1
+        if j >= len(key):
+            j = 0
+    for _ in range(623):
+        prev = mt[i - 1]
+        mt[i] = ((mt[i] ^ ((prev ^ (prev >> 30)) * 1566083941)) - i) & 0xffffffff
+        i += 1
+        if i >= 624:
+            mt[0] = mt[623]
+            i = 1
+    mt[0] = 0x80000000
+    return mt
+
+
+def _decode_seed(seed):
+    """Create the random generator of a game from its SHUFFLE seed.
+
+    The generator state is loaded into ``random.Random`` so that drawing
+    numbers runs in the C implementation of MT19937.
+    """
+    if not seed.startswith(SEED_PREFIX):
+        raise NotImplementedError('Unsupported shuffle seed: {}'.format(seed))
+    raw = base64.b64decode(seed[len(SEED_PREFIX):])
+    if len(raw) != 624 * 4:
+        raise ValueError('Unexpected seed length: {}'.format(len(raw)))
+    key = struct.unpack('<624I', raw)
+    generator = random.Random()
+    generator.setstate((3, tuple(_init_by_array(key)) + (624,), None))
+    return generator
+
+
+def _generate_yama(generator):
+    # Adopted from http://tenhou.net/stat/rand/
+    src = struct.pack(
+        '<288I', *[generator.getrandbits(32) for _ in range(288)])
+    rnd = []
+    for i in range(9):
+        digest = hashlib.sha512(src[i * 128:(i + 1) * 128]).digest()
+        rnd.extend(struct.unpack('<16I', digest))
+    yama = list(range(136))
+    for i in range(135):
+        j = i + rnd[i] % (136 - i)
+        yama[i], yama[j] = yama[j], yama[i]
+    return yama, [rnd[135] % 6, rnd[136] % 6]
+
+
+def _deal(yama, oya):
+    """Deal the initial hands; tiles are drawn from yama[135] downwards."""
+    hands = [[], [], [], []]
+    pos = 135
+    for size in [4, 4, 4, 1]:
+        for i in range(4):
+            player = (oya + i) % 4
+            hands[player].extend(yama[pos - k] for k in range(size))
+            pos -= size
+    return hands, pos
+
+
+###############################################################################
+def _verify_wall(wall, round_):
+    """Compare a reconstructed wall with what was observed in the round.
+
+    Returns
+    -------
+    list of str
+        Description of each mismatch. Empty when the wall is consistent.
+    """
+    yama = wall['yama']
+    init = round_[0]['data']
+    errors = []
+    if wall['dices'] != init['dices']:
+        errors.append('dices: {} != {}'.format(wall['dices'], init['dices']))
+    if yama[DORA_MARKERS[0]] != init['dora']:
+        errors.append('dora: {} != {}'.format(yama[DORA_MARKERS[0]], init['dora']))
+    for player, (hand, expected) in enumerate(zip(wall['haipai'], init['hands'])):
+        if sorted(hand) != sorted(expected):
+            errors.append('hai{}: {} != {}'.format(player, sorted(hand), sorted(expected)))
+
+    pos = wall['live_start']
+    kans = 0
+    rinshan = False
+    doras = 1
+    for item in round_[1:]:
+        tag, data = item['tag'], item['data']
+        if tag == 'DRAW':
+            if rinshan:
+                expected = yama[RINSHAN[kans - 1]]
+                rinshan = False
+            else:
+                expected = yama[pos]
+                pos -= 1
+            if data['tile'] != expected:
+                errors.append('draw: {} != {}'.format(expected, data['tile']))
+        elif tag == 'CALL' and data['call_type'] in ['AnKan', 'MinKan', 'KaKan']:
+            kans += 1
+            rinshan = True
+        elif tag == 'DORA':
+            expected = yama[DORA_MARKERS[doras]]
+            doras += 1
+            if data['hai'] != expected:
+                errors.append('dora: {} != {}'.format(expected, data['hai']))
+        elif tag == 'AGARI':
+            expected = [yama[i] for i in URA_MARKERS[:len(data['ura_dora'])]]
+            if data['ura_dora'] != expected:
+                errors.append('ura_dora: {} != {}'.format(expected, data['ura_dora']))
+    return errors
+
+
+def reconstruct_game_walls(root_node):
+    """Reconstruct the wall of every round from the SHUFFLE seed.
+
+    Parameters
+    ----------
+    root_node (Element)
+        Root node of mjlog XML data.
+
+    Returns
+    -------
+    list of dict
+        One item per round, with keys 'yama' (136 tiles, drawn from the
+        end; yama[0:14] is the dead wall), 'dices', 'haipai', 'live_start'
+        (index of the first tsumo), 'rinshan', 'dora_markers',
+        'ura_markers' and 'errors' (mismatches against the log).
+    """
+    parsed = parse_mjlog(root_node)
+    meta = parsed['meta']
+    if meta['GO']['config']['sanma']:
+        raise NotImplementedError("sanma")
+    generator = _decode_seed(meta['SHUFFLE']['seed'])
+    walls = []
+    for round_ in parsed['rounds']:
+        yama, dices = _generate_yama(generator)
+        haipai, live_start = _deal(yama, int(round_[0]['data']['oya']))
+        wall = {
+            'yama': yama,
+            'dices': dices,
+            'haipai': haipai,
+            'live_start': live_start,
+            'rinshan': [yama[i] for i in RINSHAN],
+            'dora_markers': [yama[i] for i in DORA_MARKERS],
+            'ura_markers': [yama[i] for i in URA_MARKERS],
+        }
+        wall['errors'] = _verify_wall(wall, round_)
+        walls.append(wall)
+    return walls
+
+
+def _reconstruct_file(filepath):
+    try:
+        return filepath, reconstruct_game_walls(load_mjlog(filepath)), None
+    except Exception as e:
+        return filepath, None, e
+
+
+def reconstruct_walls(filepaths, processes=None, chunksize=16):
+    """Reconstruct walls of many games.
+
+    Parameters
+    ----------
+    filepaths : iterable of str
+        Paths of mjlog files.
+
+    processes : int
+        When given, games are distributed over this many worker processes.
+
+    Yields
+    ------
+    tuple
+        (filepath, walls, error) in the order of ``filepaths``. ``walls`` is
+        the result of ``reconstruct_game_walls`` or None when the game failed,
+        in which case ``error`` holds the exception.
+    """
+    if processes is None:
+        for filepath in filepaths:
+            yield _reconstruct_file(filepath)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(_reconstruct_file, filepaths, chunksize)